@@ -6,6 +6,9 @@ from unassigner.algorithm import (
     UnassignerApp,
     VariableMismatchRate,
     pctdiff,
+    beta_binomial_cdf,
+    beta_binomial_pmf,
+    max_compatible_mismatches,
     soft_species_probability,
     hard_species_probability,
     threshold_assignment_probability,
@@ -32,6 +35,13 @@ class UnassignAlignerTests(unittest.TestCase):
         expected = set([("a", "8"), ("b", "5")])
         self.assertEqual(observed, expected)
 
+    def test_species_seqs(self):
+        with self.a.species_seqs as species_seqs:
+            self.assertEqual(len(species_seqs), 11)
+            self.assertTrue(species_seqs["8"].startswith("AGTCGAGCGGTAGCACAGAG"))
+        # Sequences are parsed once and reused
+        self.assertIs(self.a.species_seqs, species_seqs)
+
 
 class FunctionTests(unittest.TestCase):
     def test_pctdiff(self):
@@ -42,6 +52,30 @@ class FunctionTests(unittest.TestCase):
         self.assertEqual(soft_species_probability(5.3, 5.3), 0.5)
         self.assertEqual(soft_species_probability(2 * 5.3, 5.3), 0.5 * 0.5)
 
+    def test_beta_binomial_cdf(self):
+        self.assertEqual(beta_binomial_cdf(-1, 10, 1.0, 50.0), 0.0)
+        self.assertAlmostEqual(beta_binomial_cdf(10, 10, 1.0, 50.0), 1.0, 10)
+        self.assertAlmostEqual(beta_binomial_cdf(0, 10, 1.0, 50.0), 50 / 60, 10)
+
+    def test_beta_binomial_pmf(self):
+        self.assertAlmostEqual(beta_binomial_pmf(0, 10, 1.0, 50.0), 50 / 60, 10)
+        self.assertAlmostEqual(
+            sum(beta_binomial_pmf(k, 10, 1.5, 20.5) for k in range(11)), 1.0, 10
+        )
+        # No overflow for long sequences
+        self.assertAlmostEqual(
+            sum(beta_binomial_pmf(k, 5000, 2.5, 1000.5) for k in range(5001)),
+            1.0,
+            10,
+        )
+
+    def test_max_compatible_mismatches(self):
+        # 3 of 100 positions is exactly 3 percent
+        self.assertEqual(max_compatible_mismatches(2, 90, 10, 3.0), 1)
+        self.assertEqual(max_compatible_mismatches(0, 90, 10, 1.0), 1)
+        self.assertEqual(max_compatible_mismatches(0, 90, 10, 50.0), 10)
+        self.assertEqual(max_compatible_mismatches(5, 90, 10, 3.0), -1)
+
     def test_threshold_assignment_probability(self):
         sp = threshold_assignment_probability(
             0, 90, 10, 1.0, 50.0, 1.0, soft_species_probability
@@ -53,6 +87,14 @@ class FunctionTests(unittest.TestCase):
         )
         self.assertAlmostEqual(hp, 0.9745762711864412, 10)
 
+    def test_threshold_assignment_probability_other_fcn(self):
+        # Threshold functions without a vectorized path use iter_threshold
+        def soft_fcn(d, d_half):
+            return soft_species_probability(d, d_half)
+
+        p = threshold_assignment_probability(0, 90, 10, 1.0, 50.0, 1.0, soft_fcn)
+        self.assertAlmostEqual(p, 0.9098439687407773, 10)
+
 
 class VariableMismatchRateTests(unittest.TestCase):
     def setUp(self):
@@ -126,6 +168,36 @@ class VariableMismatchRateTests(unittest.TestCase):
             places=7,
         )
 
+    def test_unassign_thresholds(self):
+        a = AlignedPair(
+            ("a", "-----CGTGCGTCGTCACGCGTAGGTCGTTCGAAT--------------"),
+            ("s", "GCTAACGTGCGTCGTCACGCGTAGGTCGTTCGAATGCGTCGTAGTCGAC"),
+        )
+        b = AlignedPair(
+            ("b", "-----CGTGCGTCGTCACGAGTAGGTCGTTCGAAT--------------"),
+            ("s", "GCTAACGTGCGTCGTCACGCGTAGGTCGTTCGAATGCGTCGTAGTCGAC"),
+        )
+        mm_rates = [VariableMismatchRate(a), VariableMismatchRate(b)]
+        observed = VariableMismatchRate.unassign_thresholds(mm_rates, min_id=0.9)
+        expected = [r.unassign_threshold(min_id=0.9) for r in mm_rates]
+        self.assertEqual(len(observed), 2)
+        for obs, exp in zip(observed, expected):
+            self.assertEqual(obs.keys(), exp.keys())
+            self.assertAlmostEqual(
+                obs["probability_incompatible"],
+                exp["probability_incompatible"],
+                places=10,
+            )
+        self.assertEqual(VariableMismatchRate.unassign_thresholds([]), [])
+
+
+class ListAligner:
+    def __init__(self, alignments):
+        self.alignments = alignments
+
+    def search_species(self, query_seqs):
+        return iter(self.alignments)
+
 
 class UnassignerAppTests(unittest.TestCase):
     def setUp(self):
@@ -133,6 +205,31 @@ class UnassignerAppTests(unittest.TestCase):
         a = UnassignAligner(self.ggfp)
         self.app = UnassignerApp(a, VariableMismatchRate)
 
+    def test_unassign_groups_by_query(self):
+        s = "GCTAACGTGCGTCGTCACGCGTAGGTCGTTCGAATGCGTCGTAGTCGAC"
+        a1 = AlignedPair(("a", s), ("s1", s))
+        b1 = AlignedPair(("b", s), ("s1", s))
+        a2 = AlignedPair(("a", s[:-1] + "A"), ("s2", s))
+        app = UnassignerApp(ListAligner([a2, b1, a1]), VariableMismatchRate)
+        results = list(app.unassign([("a", s), ("b", s), ("c", s)]))
+        self.assertEqual([query_id for query_id, _ in results], ["a", "b", "c"])
+        a_results, b_results, c_results = [res for _, res in results]
+        self.assertEqual([r["typestrain_id"] for r in a_results], ["s1", "s2"])
+        self.assertEqual([r["typestrain_id"] for r in b_results], ["s1"])
+        self.assertEqual(c_results, [VariableMismatchRate.null_result])
+
+    def test_filter_alignments(self):
+        a = AlignedPair(("q", "ACGTACGTAC"), ("s1", "ACGTACGTAC"))
+        b = AlignedPair(("q", "ACGTACGTAC"), ("s2", "ACGTACGTAA"))
+        c = AlignedPair(("q", "ACGTACGTAC"), ("s3", "ACGTACGTAC"))
+        d = AlignedPair(("q", "ACGTACGTAC"), ("s4", "ACGAACGTAA"))
+        self.assertEqual(self.app._filter_alignments([b, a, d, c]), [a, c])
+        self.app.alignment_min_percent_id = 0.85
+        self.assertEqual(self.app._filter_alignments([b, a, d, c]), [a, c, b])
+        # Return the best alignment if none pass the threshold
+        self.assertEqual(self.app._filter_alignments([d, b]), [b])
+        self.assertEqual(self.app._filter_alignments([]), [])
+
     def test_threshold(self):
         ref_ids = set(str(x) for x in range(1, 10))
         seqs = [
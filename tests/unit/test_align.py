@@ -1,9 +1,18 @@
+import os
+import tempfile
 import unittest
+from types import SimpleNamespace
+from unittest import mock
 
 from unassigner.align import (
+    Aligner,
+    BlastAligner,
+    BlastHit,
+    ChunkedBlastAligner,
     HitExtender,
     align_semiglobal,
 )
+from unassigner.parse import parse_fasta
 
 
 class AlignSemiglobalTests(unittest.TestCase):
@@ -61,6 +70,102 @@ class AlignSemiglobalTests(unittest.TestCase):
         self.assertEqual(aligned_sseq, sseq)
 
 
+class ParseTests(unittest.TestCase):
+    def test_parse(self):
+        lines = [
+            "# BLASTN 2.2.31+\n",
+            "a\tb\t97.5\t40\t1\t0\t1\t40\t3\t42\t40\t50\tACGT\tACGA\n",
+            "\n",
+        ]
+        hits = list(Aligner._parse(lines))
+        self.assertEqual(hits, [
+            BlastHit("a", "b", 97.5, 40, 1, 0, 1, 40, 3, 42, 40, 50, "ACGT", "ACGA"),
+        ])
+        self.assertEqual(hits[0].sstart, 3)
+        self.assertEqual(hits[0]["sstart"], 3)
+        self.assertRaises(KeyError, hits[0].__getitem__, "evalue")
+        self.assertRaises(KeyError, hits[0].__getitem__, "values")
+        self.assertRaises(KeyError, hits[0].__getitem__, 1)
+        self.assertIn("qseqid", hits[0])
+        self.assertNotIn("evalue", hits[0])
+        self.assertNotIn(1, hits[0])
+
+        hits = list(Aligner._parse(lines, convert_types=False))
+        self.assertEqual(hits[0]["pident"], "97.5")
+        self.assertEqual(hits[0]["slen"], "50")
+
+
+class BlastAlignerTests(unittest.TestCase):
+    def call_args(self, aligner, **kwargs):
+        with mock.patch("unassigner.align.subprocess.check_call") as check_call:
+            aligner._call("query.fasta", "refs.fasta", "hits.txt", **kwargs)
+        args, = check_call.call_args.args
+        return args
+
+    def test_call_num_threads(self):
+        args = self.call_args(BlastAligner("refs.fasta", num_threads=4))
+        self.assertEqual(args.count("-num_threads"), 1)
+        self.assertEqual(args[args.index("-num_threads") + 1], "4")
+
+    def test_call_num_threads_kwarg_wins(self):
+        args = self.call_args(BlastAligner("refs.fasta", num_threads=4), num_threads=2)
+        self.assertEqual(args.count("-num_threads"), 1)
+        self.assertEqual(args[args.index("-num_threads") + 1], "2")
+
+    def test_call_default_threads(self):
+        args = self.call_args(BlastAligner("refs.fasta"))
+        self.assertNotIn("-num_threads", args)
+
+
+class FakeChunkedBlastAligner(ChunkedBlastAligner):
+    """Report one perfect self-hit per query instead of running BLAST"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_fps = []
+
+    def _call(self, query_fp, database_fp, output_fp, **kwargs):
+        self.query_fps.append(query_fp)
+        with open(query_fp) as f:
+            seqs = list(parse_fasta(f))
+        with open(output_fp, "w") as f:
+            for seq_id, seq in seqs:
+                n = len(seq)
+                vals = [seq_id, seq_id, 100.0, n, 0, 0, 1, n, 1, n, n, n, seq, seq]
+                f.write("\t".join(map(str, vals)) + "\n")
+
+
+class ChunkedBlastAlignerTests(unittest.TestCase):
+    def setUp(self):
+        self.seqs = [("s{0}".format(n), "ACGT" * (n + 1)) for n in range(7)]
+
+    def test_search(self):
+        a = FakeChunkedBlastAligner("refs.fasta", num_chunks=3)
+        hits = list(a.search(self.seqs))
+        self.assertEqual([h.qseqid for h in hits], [x for x, _ in self.seqs])
+        self.assertEqual(hits[6].qlen, 28)
+        self.assertEqual(len(a.query_fps), 3)
+
+    def test_search_output_fp(self):
+        output_fp = os.path.join(tempfile.mkdtemp(), "hits.txt")
+        a = FakeChunkedBlastAligner("refs.fasta", num_chunks=2)
+        hits = list(a.search(self.seqs, output_fp=output_fp))
+        self.assertEqual(len(hits), 7)
+        with open(output_fp) as f:
+            self.assertEqual(list(Aligner._parse(f)), hits)
+
+    def test_search_one_chunk(self):
+        a = FakeChunkedBlastAligner("refs.fasta", num_chunks=4)
+        hits = list(a.search(self.seqs[:1]))
+        self.assertEqual([h.qseqid for h in hits], ["s0"])
+
+    def test_search_rejects_num_threads(self):
+        a = FakeChunkedBlastAligner("refs.fasta", num_chunks=2)
+        with self.assertRaises(ValueError):
+            list(a.search(self.seqs, num_threads=4))
+        self.assertEqual(a.query_fps, [])
+
+
 class HitExtenderTests(unittest.TestCase):
     def test_is_global(self):
         hit = {
@@ -71,7 +176,7 @@ class HitExtenderTests(unittest.TestCase):
             "send": 37,
             "slen": 37,
         }
-        self.assertTrue(HitExtender._is_global(hit))
+        self.assertTrue(HitExtender._is_global(SimpleNamespace(**hit)))
 
     def test_realign_leftgap(self):
         hit = {
@@ -82,9 +187,9 @@ class HitExtenderTests(unittest.TestCase):
             "send": 68,
             "slen": 1336,
         }
-        self.assertTrue(HitExtender._needs_realignment(hit))
+        self.assertTrue(HitExtender._needs_realignment(SimpleNamespace(**hit)))
         hit["qstart"] = 1
-        self.assertFalse(HitExtender._needs_realignment(hit))
+        self.assertFalse(HitExtender._needs_realignment(SimpleNamespace(**hit)))
 
     def test_realign_rightgap(self):
         hit = {
@@ -95,39 +200,27 @@ class HitExtenderTests(unittest.TestCase):
             "send": 64,
             "slen": 1336,
         }
-        self.assertTrue(HitExtender._needs_realignment(hit))
+        self.assertTrue(HitExtender._needs_realignment(SimpleNamespace(**hit)))
         hit["qend"] = 28
-        self.assertFalse(HitExtender._needs_realignment(hit))
+        self.assertFalse(HitExtender._needs_realignment(SimpleNamespace(**hit)))
 
-    def test_add_endgaps_left(self):
-        no_endgaps = {"qstart": 1, "sstart": 1}
+    def test_endgaps_left(self):
+        self.assertEqual(HitExtender._endgaps_left(1, 1, "GG", "CC"), ("", ""))
         self.assertEqual(
-            HitExtender._add_endgaps_left(no_endgaps, "GG", "CC"), ("", "")
+            HitExtender._endgaps_left(5, 1, "ABCDEFGH", "JKLMNOP"), ("ABCD", "----")
         )
-        query_hang = {"qstart": 5, "sstart": 1}
         self.assertEqual(
-            HitExtender._add_endgaps_left(query_hang, "ABCDEFGH", "JKLMNOP"),
-            ("ABCD", "----"),
-        )
-        subject_hang = {"qstart": 1, "sstart": 4}
-        self.assertEqual(
-            HitExtender._add_endgaps_left(subject_hang, "ABCDEFGH", "JKLMNOP"),
-            ("---", "JKL"),
+            HitExtender._endgaps_left(1, 4, "ABCDEFGH", "JKLMNOP"), ("---", "JKL")
         )
 
-    def test_add_endgaps_right(self):
-        no_endgaps = {"qend": 28, "qlen": 28, "send": 14, "slen": 14}
-        self.assertEqual(
-            HitExtender._add_endgaps_right(no_endgaps, "GG", "CC"), ("", "")
-        )
-        query_hang = {"qend": 5, "qlen": 8, "send": 10, "slen": 10}
+    def test_endgaps_right(self):
+        self.assertEqual(HitExtender._endgaps_right(28, 14, 28, 14, "GG", "CC"), ("", ""))
         self.assertEqual(
-            HitExtender._add_endgaps_right(query_hang, "ABCDEFG", "JKLMNOPQRS"),
+            HitExtender._endgaps_right(5, 10, 8, 10, "ABCDEFG", "JKLMNOPQRS"),
             ("EFG", "---"),
         )
-        subject_hang = {"qend": 9, "qlen": 9, "send": 5, "slen": 7}
         self.assertEqual(
-            HitExtender._add_endgaps_right(subject_hang, "ABCDEFGH", "JKLMNOP"),
+            HitExtender._endgaps_right(9, 5, 9, 7, "ABCDEFGH", "JKLMNOP"),
             ("--", "OP"),
         )
 
@@ -3,7 +3,7 @@ import os
 import unittest
 import tempfile
 
-from unassigner.command import main
+from unassigner.command import main, OutputWriter
 from unassigner.algorithm import VariableMismatchRate
 from unassigner.parse import parse_results
 
@@ -93,6 +93,49 @@ class CommandTests(unittest.TestCase):
         self.assertAlmostEqual(result["probability_incompatible"], 0.4085, 3)
 
 
+class OutputWriterTests(unittest.TestCase):
+    def test_write_results(self):
+        output_dir = os.path.join(tempfile.mkdtemp(), "out")
+        writer = OutputWriter(output_dir, {"s1": "Species one"})
+        writer.write_results(
+            "q1",
+            [
+                {
+                    "typestrain_id": "s1",
+                    "region_mismatches": 1,
+                    "region_positions": 100,
+                    "probability_incompatible": 0.25,
+                    "mu1": 0.01,
+                },
+                {
+                    "typestrain_id": "s2",
+                    "region_mismatches": 3,
+                    "region_positions": 90,
+                    "probability_incompatible": 0.5,
+                    "mu1": 0.03,
+                },
+            ],
+        )
+        writer.standard_file.close()
+        writer.algorithm_file.close()
+
+        with open(os.path.join(output_dir, "unassigner_output.tsv")) as f:
+            results = list(parse_results(f))
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]["species"], "Species one")
+        self.assertEqual(results[1]["species"], "NA")
+        self.assertEqual(results[1]["region_mismatches"], 3)
+
+        with open(os.path.join(output_dir, "algorithm_output.tsv")) as f:
+            lines = f.readlines()
+        self.assertEqual(
+            lines[0],
+            "query_id\tspecies_name\ttypestrain_id\tregion_mismatches\t"
+            "region_positions\tprobability_incompatible\tmu1\n",
+        )
+        self.assertEqual(lines[2], "q1\tNA\ts2\t3\t90\t0.5\t0.03\n")
+
+
 # Reference mismatches only occur outside the aligned region
 fake_mismatch_positions = """\
 X94967	ref0	500	501	502	503	504	505
@@ -0,0 +1,53 @@
+import gzip
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from unassigner.download import open_text, process_greengenes_seqs
+
+
+class GreengenesTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.seqs_fp = os.path.join(self.dir, "gg.fasta.gz")
+        with gzip.open(self.seqs_fp, "wt") as f:
+            f.write(">1\nACGT\n>2\nGGCC\n>3\nACGT\n")
+        self.accessions_fp = os.path.join(self.dir, "gg_accessions.txt.gz")
+        with gzip.open(self.accessions_fp, "wt") as f:
+            f.write("#ggid\tsrc\tacc\n1\tGenbank\tAB001\n2\tGenbank\tAB002\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_process_greengenes_seqs_gzipped(self):
+        output_fp = process_greengenes_seqs(self.seqs_fp, self.accessions_fp, self.dir)
+        with open(output_fp) as f:
+            self.assertEqual(
+                f.read(), ">AB001 Genbank 1\nACGT\n>AB002 Genbank 2\nGGCC\n"
+            )
+        # Compressed input files are read in place
+        self.assertTrue(os.path.exists(self.seqs_fp))
+        self.assertTrue(os.path.exists(self.accessions_fp))
+        self.assertFalse(os.path.exists(self.seqs_fp[:-3]))
+
+    def test_process_greengenes_seqs_url(self):
+        seqs_url = pathlib.Path(self.seqs_fp).as_uri()
+        accessions_url = pathlib.Path(self.accessions_fp).as_uri()
+        output_fp = process_greengenes_seqs(seqs_url, accessions_url, self.dir)
+        with open(output_fp) as f:
+            self.assertEqual(
+                f.read(), ">AB001 Genbank 1\nACGT\n>AB002 Genbank 2\nGGCC\n"
+            )
+
+    def test_open_text_url_uncompressed(self):
+        fp = os.path.join(self.dir, "a.txt")
+        with open(fp, "w") as f:
+            f.write("abc\ndef\n")
+        with open_text(pathlib.Path(fp).as_uri()) as f:
+            self.assertEqual(list(f), ["abc\n", "def\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
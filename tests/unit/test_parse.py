@@ -1,7 +1,13 @@
 import tempfile
 import unittest
 
-from unassigner.parse import parse_fasta, parse_desc, load_fasta, write_fasta
+from unassigner.parse import (
+    FastaIndex,
+    parse_fasta,
+    parse_desc,
+    load_fasta,
+    write_fasta,
+)
 
 
 class FastaTests(unittest.TestCase):
@@ -32,6 +38,19 @@ class FastaTests(unittest.TestCase):
             load_fasta(f.name), {"Myseq": "GGCTAAGGCCT", "2ndseq": "CCCGG"}
         )
 
+    def test_fasta_index(self):
+        f = tempfile.NamedTemporaryFile(mode="wt", encoding="utf-8")
+        f.write(">Myseq asdf\n" "GGCTAA\n" "GGCCU\n" ">2ndseq *@#\n" "CCCGG\n")
+        f.seek(0)
+        with FastaIndex(f.name, trim_desc=True) as seqs:
+            self.assertEqual(len(seqs), 2)
+            self.assertEqual(list(seqs), ["Myseq", "2ndseq"])
+            self.assertEqual(seqs["2ndseq"], "CCCGG")
+            self.assertEqual(seqs["Myseq"], "GGCTAAGGCCT")
+            self.assertRaises(KeyError, seqs.__getitem__, "asdf")
+            self.assertEqual(dict(seqs), load_fasta(f.name))
+        self.assertIsNone(seqs._file)
+
     def test_write_fasta(self):
         f = tempfile.NamedTemporaryFile(mode="w+t", encoding="utf-8")
         seqs = [("a", "CCGGT"), ("b", "TTTTTTTTT")]
@@ -1,18 +1,33 @@
 import collections
+import functools
+import itertools
 import math
-import operator
 
 import numpy
+from scipy.special import betaln
 from scipy.stats import betabinom
 
 from unassigner.alignment import AlignedRegion
 from unassigner.align import VsearchAligner, HitExtender
-from unassigner.parse import parse_fasta
+from unassigner.parse import FastaIndex
 
 
-class UnassignAligner(object):
+class SpeciesAligner:
     def __init__(self, species_fp):
         self.species_fp = species_fp
+        self._species_seqs = None
+
+    @property
+    def species_seqs(self):
+        # Index the type strain sequences only once per instance
+        if self._species_seqs is None:
+            self._species_seqs = FastaIndex(self.species_fp, trim_desc=True)
+        return self._species_seqs
+
+
+class UnassignAligner(SpeciesAligner):
+    def __init__(self, species_fp):
+        super().__init__(species_fp)
         self.species_input_fp = None
         self.species_output_fp = None
         self.num_cpus = None
@@ -29,23 +44,20 @@ class UnassignAligner(object):
             query_seqs, self.species_input_fp, self.species_output_fp, **vsearch_args
         )
 
-        with open(self.species_fp) as f:
-            ref_seqs = list(parse_fasta(f, trim_desc=True))
-        xt = HitExtender(query_seqs, ref_seqs)
-        for hit in hits:
-            yield xt.extend_hit(hit)
+        with self.species_seqs as species_seqs:
+            xt = HitExtender(query_seqs, species_seqs)
+            for hit in hits:
+                yield xt.extend_hit(hit)
 
 
-class FileAligner:
+class FileAligner(SpeciesAligner):
     def __init__(self, species_fp, output_fp):
-        self.species_fp = species_fp
+        super().__init__(species_fp)
         self.output_fp = output_fp
 
     def search_species(self, seqs):
-        with open(self.species_fp) as f:
-            ref_seqs = list(parse_fasta(f, trim_desc=True))
-        xt = HitExtender(seqs, ref_seqs)
-        with open(self.output_fp) as of:
+        with self.species_seqs as species_seqs, open(self.output_fp) as of:
+            xt = HitExtender(seqs, species_seqs)
             hits = VsearchAligner._parse(of)
             for hit in hits:
                 yield xt.extend_hit(hit)
@@ -98,6 +110,54 @@ class VariableMismatchRate:
         self.query_id = alignment.query_id
 
     def unassign_threshold(self, min_id=0.975, soft_threshold=False):
+        result, params = self._threshold_params(min_id)
+
+        # Compute probability
+        if soft_threshold:
+            threshold_fcn = soft_species_probability
+        else:
+            threshold_fcn = hard_species_probability
+        prob_compatible = threshold_assignment_probability(*params, threshold_fcn)
+        result["probability_incompatible"] = 1 - prob_compatible
+        return result
+
+    @classmethod
+    def unassign_thresholds(cls, mm_rates, min_id=0.975, soft_threshold=False):
+        """Compute unassignment results for many alignments at once
+
+        Under the hard threshold, the beta-binomial CDF is evaluated
+        for all alignments in a single vectorized call.
+        """
+        if soft_threshold:
+            return [r.unassign_threshold(min_id, soft_threshold) for r in mm_rates]
+
+        results = []
+        k_maxs = []
+        ns = []
+        alphas = []
+        betas = []
+        for r in mm_rates:
+            result, params = r._threshold_params(min_id)
+            obs_mismatches, obs_positions, unobs_positions, alpha, beta, d_half = params
+            results.append(result)
+            k_maxs.append(
+                max_compatible_mismatches(
+                    obs_mismatches, obs_positions, unobs_positions, d_half
+                )
+            )
+            ns.append(unobs_positions)
+            alphas.append(alpha)
+            betas.append(beta)
+        if not results:
+            return results
+
+        # The CDF is zero for negative k_max
+        probs_compatible = betabinom.cdf(k_maxs, ns, alphas, betas)
+        for result, prob_compatible in zip(results, probs_compatible):
+            result["probability_incompatible"] = 1 - float(prob_compatible)
+        return results
+
+    def _threshold_params(self, min_id):
         # Use all the beta-binomial logic from ConstantMismatchRate,
         # just adjust alpha and beta based on reference
         # sequences. Here's how. Reparameterize beta as mu and v,
@@ -176,33 +236,26 @@ class VariableMismatchRate:
         )
         max_nonregion_mismatches = max_total_mismatches - region_mismatches
 
-        # Compute probability
-        if soft_threshold:
-            threshold_fcn = soft_species_probability
-        else:
-            threshold_fcn = hard_species_probability
-        prob_compatible = threshold_assignment_probability(
-            region_mismatches,
-            region_positions,
-            nonregion_subject_positions,
-            alpha2,
-            beta2,
-            100 * species_mismatch_threshold,
-            threshold_fcn,
-        )
-        prob_incompatible = 1 - prob_compatible
-
-        return {
+        result = {
             "typestrain_id": self.alignment.subject_id,
             "region_mismatches": region_mismatches,
             "region_positions": region_positions,
-            "probability_incompatible": prob_incompatible,
+            "probability_incompatible": None,
             "mu1": mu1,
             "num_references": len(reference_logvals),
             "mu2": mu2,
             "nonregion_positions_in_subject": nonregion_subject_positions,
             "max_nonregion_mismatches": max_nonregion_mismatches,
         }
+        params = (
+            region_mismatches,
+            region_positions,
+            nonregion_subject_positions,
+            alpha2,
+            beta2,
+            100 * species_mismatch_threshold,
+        )
+        return result, params
 
 
 def pctdiff(obs_mismatches, obs_positions, unobs_mismatches, unobs_positions):
@@ -212,13 +265,49 @@ def pctdiff(obs_mismatches, obs_positions, unobs_mismatches, unobs_positions):
 
 
 def soft_species_probability(d, d_half):
-    return math.pow(2, -d / d_half)
+    # Works elementwise on numpy arrays as well as on scalars
+    return 2.0 ** (-d / d_half)
 
 
 def hard_species_probability(d, d_half):
     return float(d <= d_half)
 
 
+# Hits to similar type strains tend to repeat the same parameters
+@functools.lru_cache(maxsize=8192)
+def beta_binomial_cdf(k_max, n, alpha, beta):
+    if k_max < 0:
+        return 0.0
+    return float(betabinom.cdf(k_max, n, alpha, beta))
+
+
+def beta_binomial_pmf(k, n, alpha, beta):
+    # Binomial coefficient in log space, to avoid overflow for large n
+    log_binom = math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+    logf = log_binom + betaln(k + alpha, n - k + beta) - betaln(alpha, beta)
+    return math.exp(logf)
+
+
+def max_compatible_mismatches(obs_mismatches, obs_positions, unobs_positions, d_half):
+    """Largest number of unobserved mismatches within the threshold
+
+    Returns -1 if the observed mismatches alone exceed the threshold.
+    """
+    total_positions = obs_positions + unobs_positions
+    k = int(math.floor(d_half * total_positions / 100)) - obs_mismatches
+    k = min(max(k, -1), unobs_positions)
+    # Settle floating point ties the same way as pctdiff
+    while (k < unobs_positions) and (
+        pctdiff(obs_mismatches, obs_positions, k + 1, unobs_positions) <= d_half
+    ):
+        k += 1
+    while (k >= 0) and (
+        pctdiff(obs_mismatches, obs_positions, k, unobs_positions) > d_half
+    ):
+        k -= 1
+    return k
+
+
 def iter_threshold(
     obs_mismatches,
     obs_positions,
@@ -229,7 +318,7 @@ def iter_threshold(
     threshold_fcn=soft_species_probability,
 ):
     for mm in range(unobs_positions + 1):
-        p_mm = betabinom.pmf(mm, unobs_positions, alpha, beta)
+        p_mm = beta_binomial_pmf(mm, unobs_positions, alpha, beta)
         d = pctdiff(obs_mismatches, obs_positions, mm, unobs_positions)
         p_species = threshold_fcn(d, d_half)
         if p_species < 1e-10:
@@ -246,6 +335,24 @@ def threshold_assignment_probability(
     d_half,
     threshold_fcn=soft_species_probability,
 ):
+    if threshold_fcn is hard_species_probability:
+        # Under a hard threshold, the sum over compatible mismatch
+        # counts is the beta-binomial CDF
+        k_max = max_compatible_mismatches(
+            obs_mismatches, obs_positions, unobs_positions, d_half
+        )
+        return beta_binomial_cdf(k_max, unobs_positions, alpha, beta)
+    if threshold_fcn is soft_species_probability:
+        # Evaluate all terms of the sum at once, with the same cutoff
+        # as iter_threshold
+        mms = numpy.arange(unobs_positions + 1)
+        d = pctdiff(obs_mismatches, obs_positions, mms, unobs_positions)
+        p_species = soft_species_probability(d, d_half)
+        keep = p_species >= 1e-10
+        mms = mms[keep]
+        p_species = p_species[keep]
+        p_mm = betabinom.pmf(mms, unobs_positions, alpha, beta)
+        return float(numpy.sum(p_mm * p_species))
     return sum(
         p_mm * p_species
         for _, p_mm, _, p_species in iter_threshold(
@@ -274,61 +381,75 @@ class UnassignerApp:
         # Step 1.
         # Align query sequences to type strain sequences. Same for all
         # algorithms.
-        alignments = self._align_query_to_type_strain(query_seqs)
+        alignments_by_query = self._align_query_to_type_strain(query_seqs)
 
         # Step 2.
         # For each query-type strain alignment, estimate distribution of
         # mismatches outside fragment. Different for constant vs. variable
         # mismatch algorithms.
-        mm_rates = [self.mm_rate(a) for a in alignments]
+        mm_rates = [
+            self.mm_rate(a)
+            for query_alignments in alignments_by_query.values()
+            for a in query_alignments
+        ]
 
         # Step 3.
         # For each query-type strain alignment, estimate unassignment
         # probability. Different for hard vs. soft threshold algorithms.
-        results = []
-        for r in mm_rates:
-            res = r.unassign_threshold(
-                min_id=self.alignment_min_percent_id,
-                soft_threshold=self.soft_threshold,
-            )
-            results.append((r.query_id, res))
+        mm_results = self.mm_rate.unassign_thresholds(
+            mm_rates,
+            min_id=self.alignment_min_percent_id,
+            soft_threshold=self.soft_threshold,
+        )
 
         # Step 4.
-        # Group by query and yield results to caller. Same for all algorithms.
-        results_by_query = collections.defaultdict(list)
-        for query_id, res in results:
-            results_by_query[query_id].append(res)
+        # Yield results to caller in the order of the queries. Results
+        # for each query are contiguous, in the same order as the
+        # alignments. Same for all algorithms.
+        mm_results = iter(mm_results)
+        results_by_query = {
+            query_id: list(itertools.islice(mm_results, len(query_alignments)))
+            for query_id, query_alignments in alignments_by_query.items()
+        }
         for query_id in query_ids:
-            query_results = results_by_query[query_id]
+            query_results = results_by_query.get(query_id)
             if not query_results:
                 query_results = [self.mm_rate.null_result]
             yield query_id, query_results
 
     def _align_query_to_type_strain(self, query_seqs):
-        # We expect query_seqs to be a list
-        query_ids = [seq_id for seq_id, seq in query_seqs]
+        """Align query sequences to type strain sequences
+
+        Returns a dict mapping each query ID with hits to its filtered
+        list of alignments.
+        """
         unsorted_alignments = self.aligner.search_species(query_seqs)
 
         alignments_by_query = collections.defaultdict(list)
         for a in unsorted_alignments:
             alignments_by_query[a.query_id].append(a)
 
-        for query_id in query_ids:
-            query_alignments = alignments_by_query[query_id]
-            query_alignments = self._filter_alignments(query_alignments)
-            for a in query_alignments:
-                yield a
+        return {
+            query_id: self._filter_alignments(query_alignments)
+            for query_id, query_alignments in alignments_by_query.items()
+        }
 
     def _filter_alignments(self, query_alignments):
-        sorted_alignments = list(
-            sorted(
-                query_alignments, key=operator.attrgetter("percent_id"), reverse=True
-            )
+        query_alignments = list(query_alignments)
+        if not query_alignments:
+            return []
+        percent_ids = numpy.fromiter(
+            (a.percent_id for a in query_alignments),
+            dtype=float,
+            count=len(query_alignments),
+        )
+        # Highest percent identity first, ties kept in input order
+        order = numpy.argsort(-percent_ids, kind="stable")
+        sorted_alignments = [query_alignments[idx] for idx in order]
+        num_filtered = int(
+            numpy.count_nonzero(percent_ids > self.alignment_min_percent_id)
         )
-        filtered_alignments = [
-            a for a in sorted_alignments if a.percent_id > self.alignment_min_percent_id
-        ]
         # Return one low-identity result if we have nothing better
-        if sorted_alignments and not filtered_alignments:
+        if num_filtered == 0:
             return sorted_alignments[:1]
-        return filtered_alignments
+        return sorted_alignments[:num_filtered]
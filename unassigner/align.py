@@ -1,10 +1,13 @@
 import abc
+import collections.abc
+import concurrent.futures
+import math
 import os.path
 import subprocess
 import tempfile
-from Bio import pairwise2
+from Bio.Align import PairwiseAligner
 
-from unassigner.parse import write_fasta, load_fasta, parse_fasta
+from unassigner.parse import write_fasta, load_fasta
 from unassigner.alignment import AlignedPair
 
 BLAST_FMT = (
@@ -30,11 +33,85 @@ BLAST_FIELD_TYPES = [
 ]
 
 
+class BlastHit:
+    """A single hit in BLAST tabular format
+
+    Fields are available as attributes. Item access by field name,
+    hit["qseqid"], is supported for code written against the
+    dict-based hit records.
+    """
+
+    __slots__ = tuple(BLAST_FIELDS)
+
+    def __init__(
+        self,
+        qseqid,
+        sseqid,
+        pident,
+        length,
+        mismatch,
+        gapopen,
+        qstart,
+        qend,
+        sstart,
+        send,
+        qlen,
+        slen,
+        qseq,
+        sseq,
+    ):
+        self.qseqid = qseqid
+        self.sseqid = sseqid
+        self.pident = pident
+        self.length = length
+        self.mismatch = mismatch
+        self.gapopen = gapopen
+        self.qstart = qstart
+        self.qend = qend
+        self.sstart = sstart
+        self.send = send
+        self.qlen = qlen
+        self.slen = slen
+        self.qseq = qseq
+        self.sseq = sseq
+
+    def __getitem__(self, field):
+        if field not in BLAST_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __contains__(self, field):
+        return field in BLAST_FIELDS
+
+    def __eq__(self, other):
+        if not isinstance(other, BlastHit):
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __repr__(self):
+        return "BlastHit({0})".format(", ".join(map(repr, self.values())))
+
+    def values(self):
+        return tuple(getattr(self, field) for field in BLAST_FIELDS)
+
+
 class Aligner(abc.ABC):
     def __init__(self, ref_seqs_fp):
         self.ref_seqs_fp = ref_seqs_fp
 
     def search(self, seqs, input_fp=None, output_fp=None, **kwargs):
+        """Search all query sequences against the reference database.
+
+        All query sequences are written to a single FASTA file and the
+        search program is called exactly once, so the cost of loading
+        the database is paid once per query set. Callers should pass
+        the full set of queries rather than calling this method per
+        query. Hits are parsed lazily from the output file.
+
+        Extra keyword arguments are passed to the search program,
+        e.g. max_target_seqs for BLAST or maxaccepts for VSEARCH to
+        cap the number of hits per query.
+        """
         if input_fp is None:
             infile = tempfile.NamedTemporaryFile(mode="w+t", encoding="utf-8")
             write_fasta(infile, seqs)
@@ -58,13 +135,16 @@ class Aligner(abc.ABC):
     def _parse(self, f, convert_types=True):
         """Parse a BLAST output file."""
         for line in f:
-            line = line.strip()
-            if line.startswith("#"):
+            line = line.rstrip("\r\n")
+            if (not line) or line.startswith("#"):
                 continue
             vals = line.split("\t")
             if convert_types:
-                vals = [fn(v) for fn, v in zip(BLAST_FIELD_TYPES, vals)]
-            yield dict(zip(BLAST_FIELDS, vals))
+                # See BLAST_FIELD_TYPES: pident is a float, length
+                # through slen are ints, all other fields are strings
+                vals[2] = float(vals[2])
+                vals[3:12] = map(int, vals[3:12])
+            yield BlastHit(*vals)
 
 
 class VsearchAligner(Aligner):
@@ -122,6 +202,10 @@ class VsearchAligner(Aligner):
 
 
 class BlastAligner(Aligner):
+    def __init__(self, ref_seqs_fp, num_threads=None):
+        super().__init__(ref_seqs_fp)
+        self.num_threads = num_threads
+
     @staticmethod
     def _index(fasta_fp):
         return subprocess.check_call(
@@ -144,6 +228,8 @@ class BlastAligner(Aligner):
             "-outfmt",
             "6 " + BLAST_FMT,
         ]
+        if self.num_threads and ("num_threads" not in kwargs):
+            args += ["-num_threads", str(self.num_threads)]
         for arg, val in kwargs.items():
             arg = "-" + arg
             if val is None:
@@ -161,116 +247,190 @@ class BlastAligner(Aligner):
         subprocess.check_call(args)
 
 
+class ChunkedBlastAligner(BlastAligner):
+    """Search chunks of the query sequences with BLAST in parallel
+
+    The query sequences are split into num_chunks files of roughly
+    equal size, and each file is searched by a separate
+    single-threaded blastn process. The processes share the same
+    database files. Hits are returned in the order of the chunks.
+    """
+
+    def __init__(self, ref_seqs_fp, num_chunks=None):
+        super().__init__(ref_seqs_fp, num_threads=1)
+        if num_chunks is None:
+            num_chunks = os.cpu_count()
+        self.num_chunks = num_chunks
+
+    def search(self, seqs, input_fp=None, output_fp=None, **kwargs):
+        """Search the query sequences against the reference database.
+
+        Unlike Aligner.search, blastn is called once per chunk, so the
+        database is loaded by each of the num_chunks processes. Every
+        process runs with one thread; passing num_threads is an error.
+        If input_fp or output_fp is given, it holds all of the query
+        sequences or hits, not just one chunk.
+        """
+        if "num_threads" in kwargs:
+            raise ValueError(
+                "ChunkedBlastAligner runs one thread per chunk; "
+                "set num_chunks instead of num_threads"
+            )
+        seqs = list(seqs)
+        num_chunks = min(self.num_chunks, len(seqs))
+        if num_chunks <= 1:
+            yield from super().search(seqs, input_fp, output_fp, **kwargs)
+            return
+
+        if input_fp is not None:
+            with open(input_fp, "w") as f:
+                write_fasta(f, seqs)
+
+        chunk_size = math.ceil(len(seqs) / num_chunks)
+        chunks = [seqs[i : i + chunk_size] for i in range(0, len(seqs), chunk_size)]
+        with tempfile.TemporaryDirectory() as chunk_dir:
+            # The work happens in blastn, so threads are enough to run
+            # the searches concurrently
+            with concurrent.futures.ThreadPoolExecutor(len(chunks)) as executor:
+                futures = [
+                    executor.submit(self._search_chunk, chunk_dir, n, chunk, **kwargs)
+                    for n, chunk in enumerate(chunks)
+                ]
+                chunk_output_fps = [future.result() for future in futures]
+
+            if output_fp is not None:
+                with open(output_fp, "w") as f:
+                    for chunk_output_fp in chunk_output_fps:
+                        with open(chunk_output_fp) as chunk_f:
+                            f.writelines(chunk_f)
+                chunk_output_fps = [output_fp]
+
+            for chunk_output_fp in chunk_output_fps:
+                with open(chunk_output_fp) as f:
+                    yield from self._parse(f)
+
+    def _search_chunk(self, chunk_dir, chunk_num, seqs, **kwargs):
+        chunk_input_fp = os.path.join(chunk_dir, "query_{0}.fasta".format(chunk_num))
+        chunk_output_fp = os.path.join(chunk_dir, "hits_{0}.txt".format(chunk_num))
+        with open(chunk_input_fp, "w") as f:
+            write_fasta(f, seqs)
+        self._call(chunk_input_fp, self.ref_seqs_fp, chunk_output_fp, **kwargs)
+        return chunk_output_fp
+
+
 class HitExtender:
     def __init__(self, query_seqs, ref_seqs):
         self.query_seqs = dict(query_seqs)
-        self.ref_seqs = dict(ref_seqs)
+        # Keep indexed references on disk rather than copying them
+        if isinstance(ref_seqs, collections.abc.Mapping):
+            self.ref_seqs = ref_seqs
+        else:
+            self.ref_seqs = dict(ref_seqs)
 
     def extend_hit(self, hit):
         # Handle the simple case where the local alignment covers both
         # sequences completely
         if self._is_global(hit):
-            return AlignedPair(
-                (hit["qseqid"], hit["qseq"]), (hit["sseqid"], hit["sseq"])
-            )
+            return AlignedPair((hit.qseqid, hit.qseq), (hit.sseqid, hit.sseq))
 
         # We are going to need some repair or realignment.
-        qseq = self.query_seqs[hit["qseqid"]]
-        assert len(qseq) == hit["qlen"]
-        sseq = self.ref_seqs[hit["sseqid"]]
-        assert len(sseq) == hit["slen"]
+        qseq = self.query_seqs[hit.qseqid]
+        assert len(qseq) == hit.qlen
+        sseq = self._get_subject_seq(hit.sseqid)
+        assert len(sseq) == hit.slen
 
         if self._needs_realignment(hit):
             aligned_qseq, aligned_sseq = align_semiglobal(qseq, sseq)
-            return AlignedPair(
-                (hit["qseqid"], aligned_qseq), (hit["sseqid"], aligned_sseq)
-            )
+            return AlignedPair((hit.qseqid, aligned_qseq), (hit.sseqid, aligned_sseq))
 
-        qleft, sleft = self._add_endgaps_left(hit, qseq, sseq)
-        qright, sright = self._add_endgaps_right(hit, qseq, sseq)
-        aligned_qseq = qleft + hit["qseq"] + qright
-        aligned_sseq = sleft + hit["sseq"] + sright
-        return AlignedPair((hit["qseqid"], aligned_qseq), (hit["sseqid"], aligned_sseq))
+        qleft, sleft, qright, sright = self._add_endgaps(hit, qseq, sseq)
+        aligned_qseq = qleft + hit.qseq + qright
+        aligned_sseq = sleft + hit.sseq + sright
+        return AlignedPair((hit.qseqid, aligned_qseq), (hit.sseqid, aligned_sseq))
 
     @staticmethod
     def _is_global(hit):
         return (
-            (hit["qstart"] == 1)
-            and (hit["sstart"] == 1)
-            and (hit["qend"] == hit["qlen"])
-            and (hit["send"] == hit["slen"])
+            (hit.qstart == 1)
+            and (hit.sstart == 1)
+            and (hit.qend == hit.qlen)
+            and (hit.send == hit.slen)
         )
 
     @staticmethod
     def _needs_realignment(hit):
-        more_to_the_left = (hit["qstart"] > 1) and (hit["sstart"] > 1)
-        more_to_the_right = (hit["qend"] < hit["qlen"]) and (hit["send"] < hit["slen"])
+        more_to_the_left = (hit.qstart > 1) and (hit.sstart > 1)
+        more_to_the_right = (hit.qend < hit.qlen) and (hit.send < hit.slen)
         return more_to_the_left or more_to_the_right
 
+    @classmethod
+    def _add_endgaps(cls, hit, qseq, sseq):
+        """Endgaps to extend the hit to the ends of both sequences
+
+        Returns a tuple of (qleft, sleft, qright, sright).
+        """
+        qstart, sstart = hit.qstart, hit.sstart
+        qend, send, qlen, slen = hit.qend, hit.send, hit.qlen, hit.slen
+        qleft, sleft = cls._endgaps_left(qstart, sstart, qseq, sseq)
+        qright, sright = cls._endgaps_right(qend, send, qlen, slen, qseq, sseq)
+        return qleft, sleft, qright, sright
+
     @staticmethod
-    def _add_endgaps_left(hit, qseq, sseq):
-        # No repair needed
-        if (hit["qstart"] == 1) and (hit["sstart"] == 1):
-            return ("", "")
-        # Query hanging off to the left
-        if (hit["qstart"] > 1) and (hit["sstart"] == 1):
-            endgap_len = hit["qstart"] - 1
-            return (qseq[:endgap_len], "-" * endgap_len)
-        # Subject hanging off to the left
-        if (hit["qstart"] == 1) and (hit["sstart"] > 1):
-            endgap_len = hit["sstart"] - 1
-            return ("-" * endgap_len, sseq[:endgap_len])
-        # Anything not meeting these conditions is bad
-        if (hit["qstart"] > 1) and (hit["sstart"] > 1):
-            raise ValueError("Unaligned sequence on left")
+    def _endgaps_left(qstart, sstart, qseq, sseq):
+        if qstart == 1:
+            # No repair needed
+            if sstart == 1:
+                return ("", "")
+            # Subject hanging off to the left
+            if sstart > 1:
+                endgap_len = sstart - 1
+                return ("-" * endgap_len, sseq[:endgap_len])
+        elif qstart > 1:
+            # Query hanging off to the left
+            if sstart == 1:
+                endgap_len = qstart - 1
+                return (qseq[:endgap_len], "-" * endgap_len)
+            # Anything not meeting these conditions is bad
+            if sstart > 1:
+                raise ValueError("Unaligned sequence on left")
         raise ValueError("Query or subject start position less than 1")
 
     @staticmethod
-    def _add_endgaps_right(hit, qseq, sseq):
-        # No repair needed
-        if (hit["qend"] == hit["qlen"]) and (hit["send"] == hit["slen"]):
-            return ("", "")
-        # Query hanging off to the right
-        if (hit["qend"] < hit["qlen"]) and (hit["send"] == hit["slen"]):
-            endgap_len = hit["qlen"] - hit["qend"]
-            return (qseq[-endgap_len:], "-" * endgap_len)
-        # Subject hanging off to the right
-        if (hit["qend"] == hit["qlen"]) and (hit["send"] < hit["slen"]):
-            endgap_len = hit["slen"] - hit["send"]
-            return ("-" * endgap_len, sseq[-endgap_len:])
-        # Anything not meeting these conditions is bad
-        if (hit["qend"] < hit["qlen"]) and (hit["send"] < hit["qlen"]):
-            raise ValueError("Unaligned sequence on right")
+    def _endgaps_right(qend, send, qlen, slen, qseq, sseq):
+        if qend == qlen:
+            # No repair needed
+            if send == slen:
+                return ("", "")
+            # Subject hanging off to the right
+            if send < slen:
+                endgap_len = slen - send
+                return ("-" * endgap_len, sseq[-endgap_len:])
+        elif qend < qlen:
+            # Query hanging off to the right
+            if send == slen:
+                endgap_len = qlen - qend
+                return (qseq[-endgap_len:], "-" * endgap_len)
+            # Anything not meeting these conditions is bad
+            if send < slen:
+                raise ValueError("Unaligned sequence on right")
         raise ValueError("Query or subject end position greater than length")
 
     def _get_subject_seq(self, subject_id):
-        subject_outfile = tempfile.NamedTemporaryFile()
-        subject_outfile_fp = subject_outfile.name
-        args = [
-            "blastdbcmd",
-            "-db",
-            self.db,
-            "-entry",
-            subject_id,
-            "-out",
-            subject_outfile_fp,
-        ]
-        subprocess.check_call(args)
-        with open(subject_outfile_fp) as f:
-            return list(parse_fasta(f, trim_desc=True))[0][1]
+        return self.ref_seqs[subject_id]
+
+
+SEMIGLOBAL_ALIGNER = PairwiseAligner(
+    mode="global",
+    match_score=5,
+    mismatch_score=-4,
+    open_gap_score=-10,
+    extend_gap_score=-0.5,
+    end_gap_score=0,
+)
 
 
 def align_semiglobal(qseq, sseq):
-    alignment = pairwise2.align.globalms(
-        sseq,
-        qseq,
-        5,
-        -4,
-        -10,
-        -0.5,  # match, mismatch, gapopen, gapextend
-        penalize_end_gaps=False,
-        one_alignment_only=True,
-    )
-    subj_seq = alignment[0][0]
-    query_seq = alignment[0][1]
+    alignment = next(iter(SEMIGLOBAL_ALIGNER.align(sseq, qseq)))
+    subj_seq = alignment[0]
+    query_seq = alignment[1]
     return query_seq, subj_seq
@@ -1,6 +1,8 @@
 import itertools
 import operator
 
+import numpy
+
 
 class AlignedPair(object):
     def __init__(self, qseq, sseq):
@@ -39,7 +41,9 @@ class AlignedPair(object):
         return self.subject_seq.replace("-", "")
 
     def count_matches(self):
-        return sum(q == s for q, s in zip(self.query_seq, self.subject_seq))
+        query_codes = numpy.frombuffer(self.query_seq.encode(), dtype=numpy.uint8)
+        subject_codes = numpy.frombuffer(self.subject_seq.encode(), dtype=numpy.uint8)
+        return int(numpy.count_nonzero(query_codes == subject_codes))
 
     @property
     def percent_id(self):
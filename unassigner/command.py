@@ -152,13 +152,17 @@ class OutputWriter:
         return os.path.join(self.output_dir, filename)
 
     @staticmethod
-    def _write_tsv_line(fileobj, vals):
-        vals = [str(val) for val in vals]
-        line = "\t".join(vals)
-        fileobj.write(line)
-        fileobj.write("\n")
+    def _format_tsv_line(vals):
+        return "\t".join(str(val) for val in vals) + "\n"
+
+    @classmethod
+    def _write_tsv_line(cls, fileobj, vals):
+        fileobj.write(cls._format_tsv_line(vals))
 
     def write_results(self, query_id, results):
+        # Collect lines for the query and write each file once
+        standard_lines = []
+        algorithm_lines = []
         for result in results:
             species_name = self.species_names.get(result["typestrain_id"], "NA")
 
@@ -166,14 +170,16 @@ class OutputWriter:
             if self.algorithm_keys is None:
                 self.algorithm_keys = list(result.keys())
                 algorithm_header = ["query_id", "species_name"] + self.algorithm_keys
-                self._write_tsv_line(self.algorithm_file, algorithm_header)
+                algorithm_lines.append(self._format_tsv_line(algorithm_header))
 
             standard_vals = [query_id, species_name] + [
                 result[k] for k in self.standard_keys
             ]
-            self._write_tsv_line(self.standard_file, standard_vals)
+            standard_lines.append(self._format_tsv_line(standard_vals))
 
             algorithm_vals = [query_id, species_name] + [
                 result[k] for k in self.algorithm_keys
             ]
-            self._write_tsv_line(self.algorithm_file, algorithm_vals)
+            algorithm_lines.append(self._format_tsv_line(algorithm_vals))
+        self.standard_file.writelines(standard_lines)
+        self.algorithm_file.writelines(algorithm_lines)
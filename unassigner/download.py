@@ -1,8 +1,10 @@
 import collections
+import contextlib
+import gzip
+import io
 import logging
 import os
 import shutil
-import subprocess
 import urllib.request
 
 from unassigner.parse import parse_fasta, parse_desc, parse_greengenes_accessions
@@ -40,6 +42,8 @@ def clean(db_dir):
         url_fp(LTP_METADATA_URL),
         url_fp(LTP_SEQS_URL),
         SPECIES_FASTA_FP,
+        url_fp(GG_SEQS_URL),
+        url_fp(GG_ACCESSIONS_URL),
         gunzip_fp(url_fp(GG_SEQS_URL)),
         gunzip_fp(url_fp(GG_ACCESSIONS_URL)),
         REFSEQS_FASTA_FP,
@@ -59,6 +63,31 @@ def gunzip_fp(fp):
     return fp[:-3]
 
 
+def is_url(fp):
+    return "://" in str(fp)
+
+
+def open_text(fp):
+    """Open a file or URL for reading text, decompressing on the fly if needed."""
+    if is_url(fp):
+        return open_url(fp)
+    if str(fp).endswith(".gz"):
+        return gzip.open(fp, "rt", encoding="utf-8")
+    return open(fp, encoding="utf-8")
+
+
+@contextlib.contextmanager
+def open_url(url):
+    """Stream text from a URL without saving it to disk."""
+    logging.info("Streaming {0}".format(url))
+    with urllib.request.urlopen(url) as resp:
+        if url.endswith(".gz"):
+            with gzip.GzipFile(fileobj=resp) as gz:
+                yield io.TextIOWrapper(gz, encoding="utf-8")
+        else:
+            yield io.TextIOWrapper(resp, encoding="utf-8")
+
+
 def get_url(url, fp):
     logging.info("Downloading {0}".format(url))
     with urllib.request.urlopen(url) as resp, open(fp, "wb") as f:
@@ -96,25 +125,15 @@ def process_greengenes_seqs(seqs_fp, accessions_fp, output_fp=REFSEQS_FASTA_FP):
         duplicates_fp = os.path.join(output_fp, duplicates_fp)
         output_fp = os.path.join(output_fp, REFSEQS_FASTA_FP)
 
-    # Extract table of accessions
-    if accessions_fp.endswith(".gz"):
-        subprocess.check_call(["gunzip", "-f", accessions_fp])
-        accessions_fp = gunzip_fp(accessions_fp)
-
     # Load accessions
     gg_accessions = {}
-    with open(accessions_fp) as f:
+    with open_text(accessions_fp) as f:
         for ggid, src, acc in parse_greengenes_accessions(f):
             gg_accessions[ggid] = (acc, src)
 
-    # Extract FASTA file
-    if seqs_fp.endswith(".gz"):
-        subprocess.check_call(["gunzip", "-f", seqs_fp])
-        seqs_fp = gunzip_fp(seqs_fp)
-
     # Remove duplicate reference seqs
     uniq_seqs = collections.defaultdict(list)
-    with open(seqs_fp) as f:
+    with open_text(seqs_fp) as f:
         for ggid, seq in parse_fasta(f):
             uniq_seqs[seq].append(ggid)
 
@@ -80,9 +80,9 @@ class MismatchLocationApp:
         ref_hits_file_read = open(reference_hits_file.name)
         hits = VsearchAligner._parse(ref_hits_file_read)
         for hit in hits:
-            if hit["pident"] > 97.0:
-                query_id = hit["qseqid"]
-                subject_id = hit["sseqid"]
+            if hit.pident > 97.0:
+                query_id = hit.qseqid
+                subject_id = hit.sseqid
                 mismatch_positions = mismatch_query_pos(hit)
                 yield (query_id, subject_id, mismatch_positions)
 
@@ -199,9 +199,9 @@ def nucleotides_compatible(nt1, nt2):
 
 
 def hit_matches_by_alignment_pos(hit):
-    qseq = hit["qseq"].upper()
-    sseq = hit["sseq"].upper()
-    query_pos = hit["qstart"]
+    qseq = hit.qseq.upper()
+    sseq = hit.sseq.upper()
+    query_pos = hit.qstart
     for q, s in zip(qseq, sseq):
         is_match = True
         if (q != s) and not nucleotides_compatible(q, s):
@@ -1,3 +1,5 @@
+import collections.abc
+import functools
 import logging
 import re
 from io import StringIO
@@ -54,6 +56,76 @@ def parse_fasta(f, trim_desc=False):
     yield desc, seq.getvalue()
 
 
+class FastaIndex(collections.abc.Mapping):
+    """Random access to the sequences in a FASTA file.
+
+    Parameters
+    ----------
+    filepath : Input filepath, FASTA format.
+    trim_desc : If True, index sequences by the first word of the
+        description, as in parse_fasta.
+
+    Notes
+    -----
+    Only the file offset of each record is held in memory, along with
+    a bounded cache of recently fetched sequences. The file is opened
+    on the first lookup and kept open until close() is called; use the
+    index as a context manager to close it when done. A closed index
+    reopens the file if it is used again.
+    """
+
+    cache_size = 1024
+
+    def __init__(self, filepath, trim_desc=False):
+        self.filepath = filepath
+        self.trim_desc = trim_desc
+        self.offsets = {}
+        with open(filepath, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.startswith(b">"):
+                    desc = line.decode().strip()[1:]
+                    if trim_desc:
+                        desc = desc.split()[0]
+                    self.offsets[desc] = offset
+                offset += len(line)
+        self._file = None
+        self._fetch = functools.lru_cache(maxsize=self.cache_size)(self._read_record)
+
+    def _read_record(self, offset):
+        if self._file is None:
+            self._file = open(self.filepath, "rb")
+        self._file.seek(offset)
+        lines = [self._file.readline().decode()]
+        while True:
+            line = self._file.readline()
+            if not line or line.startswith(b">"):
+                break
+            lines.append(line.decode())
+        _, seq = next(parse_fasta(lines))
+        return seq
+
+    def __getitem__(self, seq_id):
+        return self._fetch(self.offsets[seq_id])
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 def parse_desc(desc):
     try:
         arr = desc.split("|")
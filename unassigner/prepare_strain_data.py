@@ -47,7 +47,7 @@ def main(argv=None):
         help=(
             "Filepath for table of GreenGenes accession numbers "
             "(.txt or .txt.gz file) "
-            "[default: download from GreenGenes mirror]"
+            "[default: stream from GreenGenes mirror]"
         ),
     )
     p.add_argument(
@@ -55,7 +55,7 @@ def main(argv=None):
         help=(
             "Filepath for unaligned 16S reference sequences "
             "(.fasta or .fasta.gz file) "
-            "[default: download from GreenGenes mirror]"
+            "[default: stream from GreenGenes mirror]"
         ),
     )
     p.add_argument(
@@ -82,10 +82,9 @@ def main(argv=None):
     process_ltp_seqs(ltp_seqs_fp, db_dir)
 
     if args.download_greengenes:
-        gg_seqs_fp = use_or_download(args.greengenes_seqs_fp, GG_SEQS_URL, db_dir)
-        gg_accessions_fp = use_or_download(
-            args.greengenes_accessions_fp, GG_ACCESSIONS_URL, db_dir
-        )
+        # GreenGenes files are streamed from the mirror if not provided
+        gg_seqs_fp = args.greengenes_seqs_fp or GG_SEQS_URL
+        gg_accessions_fp = args.greengenes_accessions_fp or GG_ACCESSIONS_URL
         process_greengenes_seqs(gg_seqs_fp, gg_accessions_fp, db_dir)
 
 
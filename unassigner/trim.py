@@ -229,13 +229,13 @@ def partial_seqs(seq, min_length):
 
 
 def aligned_frac(hit):
-    unaligned_left = min(hit["qstart"], hit["sstart"])
+    unaligned_left = min(hit.qstart, hit.sstart)
     unaligned_right = min(
-        hit["qlen"] - hit["qend"],
-        hit["slen"] - hit["send"],
+        hit.qlen - hit.qend,
+        hit.slen - hit.send,
     )
     unaligned = unaligned_left + unaligned_right
-    aligned = hit["length"]
+    aligned = hit.length
     return aligned / (aligned + unaligned)
 
 